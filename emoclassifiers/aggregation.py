@@ -1,11 +1,38 @@
-from math import comb
 from typing import Any
 
+import numpy as np
+
 from emoclassifiers.classification import YesNoUnsureEnum
 
+try:
+    from numba import njit
+except ImportError:
+    def njit(*args, **kwargs):
+        """
+        No-op stand-in for `numba.njit` when numba is not installed.
+        """
+        def decorator(func):
+            return func
+        return decorator
+
+
+YES_CODE = int(YesNoUnsureEnum.YES)
+
+
+def results_to_array(results: dict[str, YesNoUnsureEnum] | np.ndarray) -> np.ndarray:
+    """
+    Convert chunk-level results to a uint8 array of result codes (in key order).
+    Arrays are passed through unchanged.
+    """
+    if isinstance(results, np.ndarray):
+        return results
+    return np.fromiter(results.values(), dtype=np.uint8, count=len(results))
 
 
 class Aggregator:
+    # Whether the aggregate can be decided from the chunks classified before the
+    # first YES, i.e. whether `stop_on_first_yes` may be used with this aggregator
+    supports_short_circuit = False
 
     @classmethod
     def aggregate(cls, results: dict[str, YesNoUnsureEnum]) -> Any:
@@ -20,30 +47,32 @@ class RawAggregator(Aggregator):
 
     @classmethod
     def aggregate(cls, results: dict[str, YesNoUnsureEnum]) -> bool:
-        return {
-            k: val == YesNoUnsureEnum.YES
-            for k, val in results.items()
-        }
+        return dict(zip(results.keys(), (results_to_array(results) == YES_CODE).tolist()))
 
 
 class AnyAggregator(Aggregator):
+    supports_short_circuit = True
 
     @classmethod
-    def aggregate(cls, results: dict[str, YesNoUnsureEnum]) -> bool:
-        return any(val == YesNoUnsureEnum.YES for val in results.values())
+    def aggregate(cls, results: dict[str, YesNoUnsureEnum] | np.ndarray) -> bool:
+        return bool((results_to_array(results) == YES_CODE).any())
     
 
 class AdjustedAggregator(Aggregator):
 
     @classmethod
-    def aggregate(cls, results: dict[str, YesNoUnsureEnum], avg_num_chunks: int = 20) -> float:
-        elems = results.values()
+    def aggregate(
+        cls,
+        results: dict[str, YesNoUnsureEnum] | np.ndarray,
+        avg_num_chunks: int = 20,
+    ) -> float:
+        elems = results_to_array(results)
         num_elems = len(elems)
         if avg_num_chunks <= 0:
             raise ValueError(f"avg_num_chunks must be positive")
 
         # Calculate the number of True values in elems
-        num_true = sum(elem == YesNoUnsureEnum.YES for elem in elems)
+        num_true = int(np.count_nonzero(elems == YES_CODE))
         num_false = num_elems - num_true
 
         # Handle the case where the sample size exceeds the total number of elements
@@ -61,15 +90,26 @@ class AdjustedAggregator(Aggregator):
             # Impossible to sample all False if there are fewer than k False
             prob_all_false = 0.0
         else:
-            combinations_all_false = comb(num_false, avg_num_chunks)
-            total_combinations = comb(num_elems, avg_num_chunks)
-            prob_all_false = combinations_all_false / total_combinations
+            prob_all_false = _prob_all_false(num_false, num_elems, avg_num_chunks)
 
         # The expected value is the probability that at least one sampled element is True
         expected_value = 1.0 - prob_all_false
         return expected_value
 
 
+@njit(cache=True)
+def _prob_all_false(num_false: int, num_elems: int, k: int) -> float:
+    """
+    Probability that k elements sampled without replacement are all False,
+    i.e. comb(num_false, k) / comb(num_elems, k), computed as a running product
+    to avoid large intermediate integers.
+    """
+    prob = 1.0
+    for j in range(k):
+        prob *= (num_false - j) / (num_elems - j)
+    return prob
+
+
 AGGREGATOR_DICT = {
     "raw": RawAggregator,
     "any": AnyAggregator,
@@ -0,0 +1,110 @@
+"""
+Caching utilities for deduplicating classification requests.
+"""
+
+import asyncio
+import weakref
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable
+
+
+class AsyncLRUCache:
+    """
+    LRU cache of async results, keyed by bytes.
+
+    Concurrent requests for the same key share a single in-flight task, so
+    identical prompts only result in one API call. Failed or cancelled tasks
+    are not cached. The computation is only cancelled once every caller
+    waiting on it has been cancelled. A caller that joined such a computation just
+    before it was cancelled recomputes instead of seeing the `CancelledError`.
+
+    Optionally backed by a persistent `diskcache.Cache` (with TTL and LRU eviction)
+    so that results can be reused across runs.
+    """
+    def __init__(
+        self,
+        maxsize: int = 8192,
+        disk_cache_dir: str | None = None,
+        disk_cache_ttl: float | None = None,
+    ):
+        self.maxsize = maxsize
+        self._tasks: OrderedDict[bytes, asyncio.Task] = OrderedDict()
+        self._num_waiters: dict[asyncio.Task, int] = {}
+        # Tasks cancelled by the cache itself, after their last waiter went away
+        self._abandoned_tasks: weakref.WeakSet[asyncio.Task] = weakref.WeakSet()
+        self.disk_cache_ttl = disk_cache_ttl
+        if disk_cache_dir is None:
+            self._disk_cache = None
+        else:
+            try:
+                import diskcache
+            except ImportError as e:
+                raise ImportError("diskcache is required for disk caching: pip install diskcache") from e
+            self._disk_cache = diskcache.Cache(disk_cache_dir, eviction_policy="least-recently-used")
+
+    async def get_or_compute(self, key: bytes, compute: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Return the cached result for `key`, or run `compute` and cache its result.
+        """
+        if self.maxsize <= 0:
+            return await self._compute(key, compute)
+        while True:
+            task = self._tasks.get(key)
+            if task is not None and task.done() and (task.cancelled() or task.exception() is not None):
+                # Failed or cancelled tasks are a miss, even before their done-callback runs
+                del self._tasks[key]
+                task = None
+            if task is None:
+                task = asyncio.ensure_future(self._compute(key, compute))
+                task.add_done_callback(lambda t: self._discard_if_failed(key, t))
+                self._tasks[key] = task
+                while len(self._tasks) > self.maxsize:
+                    self._tasks.popitem(last=False)
+            else:
+                self._tasks.move_to_end(key)
+                if task.done():
+                    return task.result()
+
+            self._num_waiters[task] = self._num_waiters.get(task, 0) + 1
+            try:
+                return await asyncio.shield(task)
+            except asyncio.CancelledError:
+                if task in self._abandoned_tasks and not asyncio.current_task().cancelling():
+                    # The shared task was abandoned by its other waiters, not by us
+                    continue
+                if self._num_waiters[task] == 1 and not task.done():
+                    # Unlink before cancelling, so new callers don't join a dying task
+                    if self._tasks.get(key) is task:
+                        del self._tasks[key]
+                    self._abandoned_tasks.add(task)
+                    task.cancel()
+                raise
+            finally:
+                self._num_waiters[task] -= 1
+                if not self._num_waiters[task]:
+                    del self._num_waiters[task]
+
+    async def _compute(self, key: bytes, compute: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Run `compute`, going through the disk cache if one is configured.
+        """
+        if self._disk_cache is None:
+            return await compute()
+        result = self._disk_cache.get(key)
+        if result is None:
+            result = await compute()
+            self._disk_cache.set(key, result, expire=self.disk_cache_ttl)
+        return result
+
+    def _discard_if_failed(self, key: bytes, task: asyncio.Task):
+        """
+        Drop a finished task from the cache if it did not produce a result.
+        """
+        if (task.cancelled() or task.exception() is not None) and self._tasks.get(key) is task:
+            del self._tasks[key]
+
+    def clear(self):
+        """
+        Clear the in-memory cache.
+        """
+        self._tasks.clear()
@@ -2,7 +2,7 @@
 Conversation chunking code. Shared with MIT.
 """
 
-import pydantic
+from dataclasses import dataclass, field
 
 USER = "user"
 ASSISTANT = "assistant"
@@ -19,13 +19,17 @@ class Chunker:
         raise NotImplementedError()
 
 
-class Chunk(pydantic.BaseModel):
+@dataclass(slots=True, frozen=True)
+class Chunk:
     """
     A chunk of a conversation (or whole conversation).
     May include prior messages as context.
     """
     chunk: list[dict]
     touches_start: bool
+    # Rendered strings, keyed by to_string arguments. Chunks are shared between
+    # classifiers with the same chunker, so each is only rendered once.
+    _rendered: dict = field(default_factory=dict, init=False, repr=False, compare=False)
 
     @classmethod
     def from_simple_convo(cls, simple_convo: list[dict], idx: int, n_context: int = 3) -> "Chunk":
@@ -39,24 +43,42 @@ class Chunk(pydantic.BaseModel):
             touches_start=start_idx == 0,
         )
 
+    def to_key(self) -> tuple:
+        """
+        Hashable representation of the chunk contents.
+        """
+        return (
+            tuple((message["role"], message["content"]) for message in self.chunk),
+            self.touches_start,
+        )
+
+    def __hash__(self) -> int:
+        return hash(self.to_key())
+
     def to_string(self, include_start_indicator: bool = True, do_truncate: bool = False) -> str:
         """
         Convert a chunk to a string.
         """
+        rendered_key = (include_start_indicator, do_truncate)
+        rendered = self._rendered.get(rendered_key)
+        if rendered is None:
+            rendered = self._rendered[rendered_key] = self._render(
+                include_start_indicator=include_start_indicator,
+                do_truncate=do_truncate,
+            )
+        return rendered
+
+    def _render(self, include_start_indicator: bool, do_truncate: bool) -> str:
         elems = []
         if include_start_indicator and self.touches_start:
             elems.append("(This is the start of the conversation.)")
+        last_idx = len(self.chunk) - 1
         for i, message in enumerate(self.chunk):
             content = message["content"].strip()
             if do_truncate:
                 content = truncate_string(content, sep="[[...Long Message Truncated...]]")
-            elems.append(
-                '[{marker}{role}{marker}] "{content}"'.format(
-                    marker="*" if i == len(self.chunk) - 1 else "",
-                    role=message["role"].upper(),
-                    content=content,
-                )
-            )
+            marker = "*" if i == last_idx else ""
+            elems.append(f'[{marker}{message["role"].upper()}{marker}] "{content}"')
         return "\n".join(elems)
 
 
@@ -110,13 +132,17 @@ class SingleExchangeChunker(Chunker):
     @classmethod
     def chunk_simple_convo(cls, simple_convo: list[dict], n_context: int = 3) -> dict:
         chunks = {}
+        # Index of the most recent OTHER_ROLE message, so we only build chunks
+        # that contain one without rescanning the context window.
+        last_other_idx = None
         for i, message in enumerate(simple_convo):
-            if message["role"] == cls.ROLE:
-                chunk_id = i
-                candidate_chunk = Chunk.from_simple_convo(simple_convo, idx=i, n_context=n_context)
-                if not any(m["role"] == cls.OTHER_ROLE for m in candidate_chunk.chunk):
+            if message["role"] == cls.OTHER_ROLE:
+                last_other_idx = i
+            elif message["role"] == cls.ROLE:
+                if last_other_idx is None or last_other_idx < i - n_context:
                     continue
-                chunks[chunk_id] = candidate_chunk
+                chunk_id = i
+                chunks[chunk_id] = Chunk.from_simple_convo(simple_convo, idx=i, n_context=n_context)
         return chunks
 
 
@@ -1,10 +1,16 @@
 import asyncio
-from enum import Enum
+import functools
+import hashlib
+from enum import IntEnum
+from typing import Awaitable, Callable
+import httpx
 import openai
-import pydantic
 import emoclassifiers.io_utils as io_utils
+from emoclassifiers.caching import AsyncLRUCache
 from emoclassifiers.chunking import Chunk, CHUNKER_DICT
 import emoclassifiers.prompt_templates as prompt_templates
+import emoclassifiers.response_format as response_format
+from emoclassifiers.response_format import ResponseFormat
 
 
 CLASSIFIER_DEFINITION_PATH_DICT = {
@@ -14,110 +20,153 @@ CLASSIFIER_DEFINITION_PATH_DICT = {
 }
 
 
-class YesNoUnsureEnum(Enum):
+class YesNoUnsureEnum(IntEnum):
     """
     Classification output.
     """
-    YES = "yes"
-    NO = "no"
-    UNSURE = "unsure"
+    NO = 0
+    YES = 1
+    UNSURE = 2
 
-
-class ResponseFormat(pydantic.BaseModel):
-    """
-    Response format for structured completion.
-    """
-    response: YesNoUnsureEnum
+    @classmethod
+    def from_response(cls, response: response_format.YesNoUnsureEnum) -> "YesNoUnsureEnum":
+        """
+        Convert a parsed structured completion response.
+        """
+        return cls[response.name]
 
 
 def format_criteria(criteria: list[str]) -> str:
     """
     Format criteria for EmoClassifiers V2.
     """
+    return _format_criteria(tuple(criteria))
+
+
+@functools.lru_cache(maxsize=1024)
+def _format_criteria(criteria: tuple[str, ...]) -> str:
     return "\n".join(
         [f"- {line}" for line in criteria]
     )
 
 
-def get_emo_classifiers_v1_prompt(
-    classifier_definition: dict,
-    chunk: Chunk,
-) -> str:
+def split_prompt_template(template: str, placeholder: str, **kwargs) -> tuple[str, str]:
+    """
+    Split a prompt template around a placeholder, and fill in the remaining fields.
+    """
+    prefix, suffix = template.split("{" + placeholder + "}")
+    return prefix.format(**kwargs), suffix.format(**kwargs)
+
+
+def get_emo_classifiers_v1_prompt_parts(classifier_definition: dict) -> tuple[str, str]:
     """
-    Construct classification prompt for EmoClassifiers V1 (sub-classifier).
+    Construct classification prompt prefix and suffix for EmoClassifiers V1 (sub-classifier).
     """
     assert classifier_definition["version"] == "v1"
-    return prompt_templates.EMO_CLASSIFIER_V1_PROMPT_TEMPLATE.format(
+    return split_prompt_template(
+        prompt_templates.EMO_CLASSIFIER_V1_PROMPT_TEMPLATE,
+        "snippet_string",
         classifier_name=classifier_definition["name"],
         prompt=classifier_definition["prompt"],
-        snippet_string=chunk.to_string(),
         prompt_short=classifier_definition["prompt"].splitlines()[0],
     )
 
 
-def get_emo_classifiers_v1_top_level_prompt(
-    classifier_definition: dict,
-    chunk: Chunk,
-) -> str:
+def get_emo_classifiers_v1_top_level_prompt_parts(classifier_definition: dict) -> tuple[str, str]:
     """
-    Construct classification prompt for EmoClassifiers V1 (Top Level).
+    Construct classification prompt prefix and suffix for EmoClassifiers V1 (Top Level).
     """
     assert classifier_definition["version"] == "v1_top_level"
-    return prompt_templates.EMO_CLASSIFIER_V1_TOP_LEVEL_PROMPT_TEMPLATE.format(
+    return split_prompt_template(
+        prompt_templates.EMO_CLASSIFIER_V1_TOP_LEVEL_PROMPT_TEMPLATE,
+        "conversation_string",
         classifier_name=classifier_definition["name"],
         prompt=classifier_definition["prompt"],
-        conversation_string=chunk.to_string(),
     )
 
 
-def get_emo_classifiers_v2_prompt(
-    classifier_definition: dict,
-    chunk: Chunk,
-) -> str:
+def get_emo_classifiers_v2_prompt_parts(classifier_definition: dict) -> tuple[str, str]:
     """
-    Construct classification prompt for EmoClassifiers V2.
+    Construct classification prompt prefix and suffix for EmoClassifiers V2.
     """
     assert classifier_definition["version"] == "v2"
-    return prompt_templates.EMO_CLASSIFIER_V2_PROMPT_TEMPLATE.format(
+    return split_prompt_template(
+        prompt_templates.EMO_CLASSIFIER_V2_PROMPT_TEMPLATE,
+        "snippet_string",
         classifier_name=classifier_definition["full_name"],
         criteria=format_criteria(classifier_definition["criteria"]),
-        snippet_string=chunk.to_string(),
         prompt=classifier_definition["prompt"],
     )
 
 
-def get_emo_classifiers_prompt( 
-    classifier_definition: dict,
-    chunk: Chunk,
-) -> str:
+def get_emo_classifiers_prompt_parts(classifier_definition: dict) -> tuple[str, str]:
     """
-    Construct classification prompt.
+    Construct the parts of the classification prompt that come before and after
+    the conversation chunk. These only depend on the classifier definition.
     """
     if classifier_definition["version"] == "v1":
-        return get_emo_classifiers_v1_prompt(classifier_definition=classifier_definition, chunk=chunk)
+        return get_emo_classifiers_v1_prompt_parts(classifier_definition=classifier_definition)
     elif classifier_definition["version"] == "v1_top_level":
-        return get_emo_classifiers_v1_top_level_prompt(classifier_definition=classifier_definition, chunk=chunk)
+        return get_emo_classifiers_v1_top_level_prompt_parts(classifier_definition=classifier_definition)
     elif classifier_definition["version"] == "v2":
-        return get_emo_classifiers_v2_prompt(classifier_definition=classifier_definition, chunk=chunk)
+        return get_emo_classifiers_v2_prompt_parts(classifier_definition=classifier_definition)
     else:
         raise ValueError(f"Unknown version: {classifier_definition['version']}")
 
 
+def get_emo_classifiers_prompt(
+    classifier_definition: dict,
+    chunk: Chunk,
+) -> str:
+    """
+    Construct classification prompt.
+    """
+    prefix, suffix = get_emo_classifiers_prompt_parts(classifier_definition=classifier_definition)
+    return f"{prefix}{chunk.to_string()}{suffix}"
+
+
+def get_default_openai_client(max_connections: int) -> openai.AsyncOpenAI:
+    """
+    Construct an OpenAI async client with an HTTP/2 connection pool, so that
+    concurrent requests reuse (and multiplex over) a small number of connections.
+    """
+    http_client = openai.DefaultAsyncHttpxClient(
+        http2=True,
+        limits=httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_connections,
+        ),
+    )
+    return openai.AsyncOpenAI(http_client=http_client)
+
+
 class ModelWrapper:
     def __init__(
         self,
         openai_client: openai.AsyncOpenAI | None = None,
         model: str = "gpt-4o-mini-2024-07-18",
-        max_concurrent: int = 5,
+        max_concurrent: int = 20,
+        cache_size: int = 8192,
+        cache_dir: str | None = None,
+        cache_ttl: float | None = None,
     ):
         """
         A wrapper around the OpenAI async client with semaphore and model name.
+
+        Results are cached by prompt, so identical requests (e.g. conversations
+        sharing leading turns) only hit the API once. Set `cache_size=0` to disable
+        the in-memory cache, and `cache_dir` to persist results across runs.
         """
         if openai_client is None:
-            openai_client = openai.AsyncOpenAI()
+            openai_client = get_default_openai_client(max_connections=max_concurrent)
         self.openai_client = openai_client
         self.model = model
         self.semaphore = asyncio.Semaphore(max_concurrent)
+        self.result_cache = AsyncLRUCache(
+            maxsize=cache_size,
+            disk_cache_dir=cache_dir,
+            disk_cache_ttl=cache_ttl,
+        )
 
     async def classify_conversation_chunk(
         self,
@@ -129,17 +178,172 @@ class ModelWrapper:
         Classify a single conversaiton chunk.
         """
         prompt = get_emo_classifiers_prompt(classifier_definition=classifier_definition, chunk=chunk)
+        return await self.classify_prompt(prompt=prompt, max_completion_tokens=max_completion_tokens)
+
+    async def classify_prompt(
+        self,
+        prompt: str,
+        max_completion_tokens: int = 20,
+    ) -> YesNoUnsureEnum:
+        """
+        Classify a fully constructed classification prompt.
+        """
+        cache_key = hashlib.blake2b(
+            f"{self.model}\0{max_completion_tokens}\0{prompt}".encode()
+        ).digest()
+        return await self.result_cache.get_or_compute(
+            cache_key,
+            lambda: self._complete(prompt=prompt, max_completion_tokens=max_completion_tokens),
+        )
+
+    async def _complete(self, prompt: str, max_completion_tokens: int) -> YesNoUnsureEnum:
+        """
+        Run a single completion under the semaphore.
+        """
         async with self.semaphore:
-            response = await self.openai_client.beta.chat.completions.parse(
-                model=self.model,
-                messages=[{"role": "user", "content": prompt}],
-                response_format=ResponseFormat,
-                max_completion_tokens=max_completion_tokens,
-            )
+            return await self._parse(prompt=prompt, max_completion_tokens=max_completion_tokens)
+
+    async def _parse(self, prompt: str, max_completion_tokens: int) -> YesNoUnsureEnum:
+        """
+        Call the OpenAI API and parse the structured response.
+        """
+        response = await self.openai_client.beta.chat.completions.parse(
+            model=self.model,
+            messages=[{"role": "user", "content": prompt}],
+            response_format=ResponseFormat,
+            max_completion_tokens=max_completion_tokens,
+        )
         message = response.choices[0].message
         assert message.parsed, "Failed to parse response"
-        return message.parsed.response
-    
+        return YesNoUnsureEnum.from_response(message.parsed.response)
+
+
+class BatchedModelWrapper(ModelWrapper):
+    def __init__(
+        self,
+        openai_client: openai.AsyncOpenAI | None = None,
+        model: str = "gpt-4o-mini-2024-07-18",
+        max_concurrent: int = 5,
+        max_batch_size: int = 16,
+        batch_timeout: float = 0.01,
+        cache_size: int = 8192,
+        cache_dir: str | None = None,
+        cache_ttl: float | None = None,
+    ):
+        """
+        A model wrapper that coalesces chunk-level requests into micro-batches.
+
+        Requests are queued and dispatched together once `max_batch_size` requests
+        are waiting or `batch_timeout` seconds have passed since the first one.
+        Each batch is sent as parallel completions under a single semaphore
+        acquire, so `max_concurrent` bounds the number of in-flight batches.
+        """
+        if openai_client is None:
+            openai_client = get_default_openai_client(max_connections=max_concurrent * max_batch_size)
+        super().__init__(
+            openai_client=openai_client,
+            model=model,
+            max_concurrent=max_concurrent,
+            cache_size=cache_size,
+            cache_dir=cache_dir,
+            cache_ttl=cache_ttl,
+        )
+        if max_batch_size <= 0:
+            raise ValueError("max_batch_size must be positive")
+        self.max_concurrent = max_concurrent
+        self.max_batch_size = max_batch_size
+        self.batch_timeout = batch_timeout
+        self._queue = None
+        self._worker = None
+        self._loop = None
+        self._batch_tasks = set()
+
+    async def _complete(self, prompt: str, max_completion_tokens: int) -> YesNoUnsureEnum:
+        """
+        Queue a completion and wait for its batch to be dispatched.
+        """
+        self._ensure_worker()
+        future = self._loop.create_future()
+        await self._queue.put((future, prompt, max_completion_tokens))
+        return await future
+
+    def _ensure_worker(self):
+        """
+        Start the batching worker on the running event loop, restarting it if
+        the wrapper is reused across event loops (e.g. multiple `asyncio.run` calls).
+        """
+        loop = asyncio.get_running_loop()
+        if self._loop is loop and self._worker is not None and not self._worker.done():
+            return
+        if self._loop is not None:
+            self.semaphore = asyncio.Semaphore(self.max_concurrent)
+        self._loop = loop
+        self._queue = asyncio.Queue()
+        self._worker = loop.create_task(self._run_worker())
+
+    async def _run_worker(self):
+        """
+        Collect queued requests into batches and dispatch them.
+        """
+        while True:
+            batch = [await self._queue.get()]
+            deadline = self._loop.time() + self.batch_timeout
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - self._loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout=timeout))
+                except asyncio.TimeoutError:
+                    break
+            batch_task = self._loop.create_task(self._dispatch_batch(batch))
+            self._batch_tasks.add(batch_task)
+            batch_task.add_done_callback(self._batch_tasks.discard)
+
+    async def _dispatch_batch(self, batch: list[tuple[asyncio.Future, str, int]]):
+        """
+        Run a batch of completions, resolving each request's future as its completion finishes.
+        Cancelling a request's future cancels its in-flight completion.
+        """
+        try:
+            async with self.semaphore:
+                parse_tasks = []
+                for future, prompt, max_completion_tokens in batch:
+                    if future.cancelled():
+                        continue
+                    parse_task = asyncio.ensure_future(
+                        self._parse(prompt=prompt, max_completion_tokens=max_completion_tokens)
+                    )
+                    parse_task.add_done_callback(functools.partial(_resolve_future, future))
+                    future.add_done_callback(functools.partial(_cancel_if_cancelled, parse_task))
+                    parse_tasks.append(parse_task)
+                await asyncio.gather(*parse_tasks, return_exceptions=True)
+        except asyncio.CancelledError:
+            for future, _, _ in batch:
+                future.cancel()
+            raise
+
+
+def _resolve_future(future: asyncio.Future, task: asyncio.Task):
+    """
+    Pass the outcome of the task serving a request on to the request's future.
+    """
+    if future.done():
+        return
+    if task.cancelled():
+        future.cancel()
+    elif task.exception() is not None:
+        future.set_exception(task.exception())
+    else:
+        future.set_result(task.result())
+
+
+def _cancel_if_cancelled(task: asyncio.Task, future: asyncio.Future):
+    """
+    Propagate the cancellation of a request's future to the task serving it.
+    """
+    if future.cancelled():
+        task.cancel()
 
 
 class EmoClassifier:
@@ -153,27 +357,134 @@ class EmoClassifier:
         """
         self.model_wrapper = model_wrapper
         self.classifier_definition = classifier_definition
+        self._prompt_prefix, self._prompt_suffix = get_emo_classifiers_prompt_parts(
+            classifier_definition=classifier_definition,
+        )
 
-    async def classify_conversation(self, conversation: list[dict]) -> list[dict]:
+    async def classify_conversation(
+        self,
+        conversation: list[dict],
+        stop_on_first_yes: bool = False,
+    ) -> list[dict]:
         """
         Classify a conversation. Depending on the classifier definition, it may
         chunk the conversation and return a dictionary of classifications, or it
         may return a single classification. Keys will be the index of the first message.
+
+        If `stop_on_first_yes` is set, outstanding chunk requests are cancelled as soon
+        as any chunk is classified as YES, and only the completed chunks are returned.
+        This is only suitable for aggregators with `supports_short_circuit` set.
+        """
+        return await self.classify_chunks(
+            self.chunk_conversation(conversation),
+            stop_on_first_yes=stop_on_first_yes,
+        )
+
+    async def classify_chunks(
+        self,
+        chunks: dict[int, Chunk],
+        stop_on_first_yes: bool = False,
+    ) -> dict:
+        """
+        Classify chunks from `chunk_conversation`, e.g. to share chunks between classifiers
+        with the same chunker. See `classify_conversation` for `stop_on_first_yes`.
+        """
+        chunk_tasks = self.create_chunk_tasks(chunks, stop_on_first_yes=stop_on_first_yes)
+        try:
+            if chunk_tasks.tasks:
+                await asyncio.wait(chunk_tasks.tasks.values(), return_when=asyncio.FIRST_EXCEPTION)
+        finally:
+            chunk_tasks.cancel()
+            await asyncio.gather(*chunk_tasks.tasks.values(), return_exceptions=True)
+        return chunk_tasks.results()
+
+    def create_chunk_tasks(
+        self,
+        chunks: dict[int, Chunk],
+        stop_on_first_yes: bool = False,
+        create_task: Callable[[Awaitable], asyncio.Task] = asyncio.ensure_future,
+    ) -> "ChunkTasks":
+        """
+        Start one classification task per chunk, e.g. with `create_task=tg.create_task`
+        to run the chunks of several classifiers in one `asyncio.TaskGroup`.
+        See `classify_conversation` for `stop_on_first_yes`.
+        """
+        return ChunkTasks(
+            tasks={
+                chunk_id: create_task(self.classify_chunk(chunk))
+                for chunk_id, chunk in chunks.items()
+            },
+            stop_on_first_yes=stop_on_first_yes,
+        )
+
+    def chunk_conversation(self, conversation: list[dict]) -> dict[int, Chunk]:
+        """
+        Chunk a conversation with this classifier's chunker.
         """
         chunker = CHUNKER_DICT[self.classifier_definition["chunker"]]
-        chunks = chunker.chunk_simple_convo(conversation)
-        keys = []
-        futures = []
-        for chunk_id, chunk in chunks.items():
-            futures.append(
-                self.model_wrapper.classify_conversation_chunk(
-                    classifier_definition=self.classifier_definition,
-                    chunk=chunk,
-                )
-            )
-            keys.append(chunk_id)
-        results = await asyncio.gather(*futures)
-        return {key: result for key, result in zip(keys, results)}
+        return chunker.chunk_simple_convo(conversation)
+
+    async def classify_chunk(self, chunk: Chunk) -> YesNoUnsureEnum:
+        """
+        Classify a single chunk using the precomputed prompt prefix and suffix.
+        """
+        return await self.model_wrapper.classify_prompt(
+            prompt=f"{self._prompt_prefix}{chunk.to_string()}{self._prompt_suffix}",
+        )
+
+
+
+class ChunkTasks:
+    def __init__(self, tasks: dict[int, asyncio.Task], stop_on_first_yes: bool = False):
+        """
+        Chunk-level classification tasks for one classifier over one conversation.
+
+        If `stop_on_first_yes` is set, the remaining tasks are cancelled as soon as any
+        chunk is classified as YES. Only the tasks cancelled this way are left out of
+        `results`; any other cancellation or error is raised.
+        """
+        self.tasks = tasks
+        self._short_circuited = set()
+        if stop_on_first_yes:
+            for task in tasks.values():
+                task.add_done_callback(self._cancel_on_yes)
+
+    def _cancel_on_yes(self, task: asyncio.Task):
+        if task.cancelled() or task.exception() is not None:
+            return
+        if task.result() == YesNoUnsureEnum.YES:
+            for other_task in self.tasks.values():
+                if other_task.cancel():
+                    self._short_circuited.add(other_task)
+
+    def cancel(self):
+        """
+        Cancel the tasks that have not finished yet.
+        """
+        for task in self.tasks.values():
+            task.cancel()
+
+    def results(self) -> dict:
+        """
+        Results of the finished tasks, keyed by chunk id.
+        """
+        for task in self.tasks.values():
+            # Raise errors before any cancellations they caused
+            if task.done() and not task.cancelled() and task.exception() is not None:
+                raise task.exception()
+        return {
+            chunk_id: task.result()
+            for chunk_id, task in self.tasks.items()
+            if not (task in self._short_circuited and task.cancelled())
+        }
+
+
+@functools.lru_cache(maxsize=None)
+def _load_definitions(path: str) -> dict:
+    """
+    Load classifier definitions from a JSON file, cached by path.
+    """
+    return io_utils.load_json(path)
 
 
 def load_classifiers(
@@ -190,10 +501,11 @@ def load_classifiers(
         path = CLASSIFIER_DEFINITION_PATH_DICT[classifier_set]
     else:
         path = custom_path
-    definitions = io_utils.load_json(io_utils.get_path(path))
+    definitions = _load_definitions(io_utils.get_path(path))
     return {
         name: EmoClassifier(
-            classifier_definition=definition,
+            # Shallow copy so that edits to one classifier's definition don't leak into the cache
+            classifier_definition=dict(definition),
             model_wrapper=model_wrapper,
         )
         for name, definition in definitions.items()
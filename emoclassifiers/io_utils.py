@@ -1,5 +1,25 @@
+import asyncio
+import functools
 import json
+import os
+from collections import deque
 from importlib import resources
+from typing import AsyncIterator, Awaitable, Iterable, Iterator
+
+try:
+    import aiofiles
+except ImportError:
+    aiofiles = None
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 
 def load_json(path: str) -> dict:
@@ -20,20 +40,103 @@ def save_json(data: dict, path: str):
 
 def load_jsonl(path: str) -> list[dict]:
     """
-    Load a JSONL file.
+    Load a JSONL file. Uses msgspec or orjson if available.
     """
-    with open(path, "r") as f:
-        return [json.loads(line) for line in f]
+    if msgspec is not None:
+        loads = msgspec.json.Decoder().decode
+    elif orjson is not None:
+        loads = orjson.loads
+    else:
+        loads = json.loads
+    with open(path, "rb") as f:
+        return [loads(line) for line in f]
 
 
 def save_jsonl(data: list[dict], path: str):
     """
-    Save a JSONL file.
+    Save a JSONL file. Uses orjson if available.
     """
-    with open(path, "w") as f:
+    with open(path, "wb") as f:
         for item in data:
-            f.write(json.dumps(item) + "\n")
+            f.write(dumps_jsonl_line(item))
+
 
+async def save_jsonl_as_completed(futures: Iterable[Awaitable[dict]], path: str, window: int = 16):
+    """
+    Save a JSONL file incrementally as results complete, in the order of `futures`.
+    At most `window` futures are run (or held once complete) at a time, so pass a
+    generator to avoid creating all of the work up front.
+    Uses aiofiles for non-blocking writes if available.
+    """
+    if aiofiles is None:
+        with open(path, "wb") as f:
+            async for data in _iter_jsonl_in_order(futures, window=window):
+                f.write(data)
+    else:
+        async with aiofiles.open(path, "wb") as f:
+            async for data in _iter_jsonl_in_order(futures, window=window):
+                await f.write(data)
+
+
+async def _iter_jsonl_in_order(futures: Iterable[Awaitable[dict]], window: int) -> AsyncIterator[bytes]:
+    """
+    Yield serialized JSONL lines in order over a sliding window of `window` tasks:
+    the future `window` places after a line is only started once that line is yielded.
+    Consecutive lines that are ready at the same time are grouped. If a future
+    raises, the tasks still running are cancelled.
+    """
+    if window <= 0:
+        raise ValueError("window must be positive")
+    futures = iter(futures)
+    pending = deque()
+    try:
+        for _ in range(window):
+            if not _start_next(futures, pending):
+                break
+        while pending:
+            while not pending[0].done():
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    # Raise errors right away, rather than once the tasks before them finish
+                    if task.exception() is not None:
+                        raise task.exception()
+            lines = []
+            while pending and pending[0].done():
+                lines.append(dumps_jsonl_line(pending.popleft().result()))
+                _start_next(futures, pending)
+            yield b"".join(lines)
+    finally:
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
 
+
+def _start_next(futures: Iterator[Awaitable[dict]], pending: deque) -> bool:
+    """
+    Start the next future as a task, if any are left.
+    """
+    future = next(futures, None)
+    if future is None:
+        return False
+    pending.append(asyncio.ensure_future(future))
+    return True
+
+
+def dumps_jsonl_line(item: dict) -> bytes:
+    """
+    Serialize a single JSONL line, including the trailing newline.
+    """
+    if orjson is None:
+        return (json.dumps(item) + "\n").encode()
+    # Results may be keyed by chunk index, which orjson only allows with OPT_NON_STR_KEYS
+    return orjson.dumps(item, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_APPEND_NEWLINE)
+
+
+@functools.lru_cache(maxsize=None)
 def get_path(rel_path: str) -> str:
+    """
+    Resolve a path relative to the installed package. Absolute paths are returned as-is.
+    """
+    if os.path.isabs(rel_path):
+        return rel_path
     return str(resources.files("emoclassifiers").joinpath(rel_path))
@@ -0,0 +1,26 @@
+"""
+Structured completion response format.
+
+The schema sent to the model is derived from these classes, so their names,
+docstrings and values must stay fixed to reproduce published classifier behaviour.
+"""
+
+from enum import Enum
+
+import pydantic
+
+
+class YesNoUnsureEnum(Enum):
+    """
+    Classification output.
+    """
+    YES = "yes"
+    NO = "no"
+    UNSURE = "unsure"
+
+
+class ResponseFormat(pydantic.BaseModel):
+    """
+    Response format for structured completion.
+    """
+    response: YesNoUnsureEnum
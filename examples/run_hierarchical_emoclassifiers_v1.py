@@ -1,50 +1,83 @@
 import argparse
 import asyncio
-import openai
+from collections import defaultdict
 
 import emoclassifiers.io_utils as io_utils
 import emoclassifiers.classification as classification
 import emoclassifiers.aggregation as aggregation
 
 
+def get_inverse_dependency_graph(
+    sub_classifiers: dict[str, classification.EmoClassifier],
+    dependency_graph: dict,
+) -> dict[str, list[str]]:
+    """
+    Map each top-level classifier to the sub-classifiers that depend on it.
+    """
+    inverse_dependency_graph = defaultdict(list)
+    for sub_classifier_name in sub_classifiers:
+        for top_level_classifier_name in dependency_graph[sub_classifier_name]:
+            inverse_dependency_graph[top_level_classifier_name].append(sub_classifier_name)
+    return inverse_dependency_graph
+
+
 async def run_classification_on_single_conversation(
     conversation: list[dict],
     top_level_classifiers: dict[str, classification.EmoClassifier],
     sub_classifiers: dict[str, classification.EmoClassifier],
-    dependency_graph: dict,
+    inverse_dependency_graph: dict[str, list[str]],
     aggregator: aggregation.Aggregator,
 ) -> list[dict]:
-    top_level_futures_keys = []
-    top_level_futures = []
-    for top_level_classifier_name, top_level_classifier in top_level_classifiers.items():
-        top_level_futures.append(top_level_classifier.classify_conversation(conversation))
-        top_level_futures_keys.append({
-            "classifier_name": top_level_classifier_name,
-        })
-    top_level_raw_results = await asyncio.gather(*top_level_futures)
-    top_level_results = {
-        key["classifier_name"]: aggregation.AnyAggregator.aggregate(raw_result)
-        for key, raw_result in zip(top_level_futures_keys, top_level_raw_results)
-    }
-    
-    sub_futures = []
-    sub_futures_keys = []
-    for sub_classifier_name, sub_classifier in sub_classifiers.items():
-        depends_on = dependency_graph[sub_classifier_name]
-        if not any(top_level_results[dep] for dep in depends_on):
-            continue
-        sub_futures.append(sub_classifier.classify_conversation(conversation))
-        sub_futures_keys.append({
-            "classifier_name": sub_classifier_name,
-        })
-    sub_level_raw_results = await asyncio.gather(*sub_futures)
-    sub_level_results = {
-        key["classifier_name"]: aggregator.aggregate(raw_result)
-        for key, raw_result in zip(sub_futures_keys, sub_level_raw_results)
-    }
+    top_level_results = {}
+    sub_tasks = {}
+    # Classifiers sharing a chunker share chunks, so each chunk is only rendered once
+    chunks_by_chunker = {}
+
+    def get_chunks(classifier: classification.EmoClassifier) -> dict:
+        chunker_name = classifier.classifier_definition["chunker"]
+        if chunker_name not in chunks_by_chunker:
+            chunks_by_chunker[chunker_name] = classifier.chunk_conversation(conversation)
+        return chunks_by_chunker[chunker_name]
+
+    async def run_top_level_classifier(
+        tg: asyncio.TaskGroup,
+        top_level_classifier_name: str,
+        top_level_classifier: classification.EmoClassifier,
+    ):
+        raw_result = await top_level_classifier.classify_chunks(
+            get_chunks(top_level_classifier),
+            stop_on_first_yes=aggregation.AnyAggregator.supports_short_circuit,
+        )
+        top_level_result = aggregation.AnyAggregator.aggregate(raw_result)
+        top_level_results[top_level_classifier_name] = top_level_result
+        if not top_level_result:
+            return
+        # Launch dependent sub-classifiers right away, without waiting on the
+        # remaining top-level classifiers
+        for sub_classifier_name in inverse_dependency_graph[top_level_classifier_name]:
+            if sub_classifier_name in sub_tasks:
+                continue
+            sub_tasks[sub_classifier_name] = tg.create_task(
+                sub_classifiers[sub_classifier_name].classify_chunks(
+                    get_chunks(sub_classifiers[sub_classifier_name]),
+                    stop_on_first_yes=aggregator.supports_short_circuit,
+                )
+            )
+
+    async with asyncio.TaskGroup() as tg:
+        for top_level_classifier_name, top_level_classifier in top_level_classifiers.items():
+            tg.create_task(run_top_level_classifier(tg, top_level_classifier_name, top_level_classifier))
+
     return {
-        "top_level": top_level_results,
-        "sub_level": sub_level_results,
+        "top_level": {
+            top_level_classifier_name: top_level_results[top_level_classifier_name]
+            for top_level_classifier_name in top_level_classifiers
+        },
+        "sub_level": {
+            sub_classifier_name: aggregator.aggregate(sub_tasks[sub_classifier_name].result())
+            for sub_classifier_name in sub_classifiers
+            if sub_classifier_name in sub_tasks
+        },
     }
 
 
@@ -54,23 +87,30 @@ async def run_classification(
     sub_classifiers: dict[str, classification.EmoClassifier],
     dependency_graph: dict,
     aggregator: aggregation.Aggregator,
-) -> list[dict]:
+    output_path: str,
+    max_inflight_conversations: int = 16,
+):
     print(
         f"Running {len(conversation_list)} conversations"
         f" with {len(top_level_classifiers)} top-level classifiers"
         f" and {len(sub_classifiers)} sub-classifiers"
     )
-    futures = [
+    inverse_dependency_graph = get_inverse_dependency_graph(
+        sub_classifiers=sub_classifiers,
+        dependency_graph=dependency_graph,
+    )
+
+    futures = (
         run_classification_on_single_conversation(
             conversation=conversation,
             top_level_classifiers=top_level_classifiers,
             sub_classifiers=sub_classifiers,
-            dependency_graph=dependency_graph,
+            inverse_dependency_graph=inverse_dependency_graph,
             aggregator=aggregator,
         )
         for conversation in conversation_list
-    ]
-    return await asyncio.gather(*futures)
+    )
+    await io_utils.save_jsonl_as_completed(futures, output_path, window=max_inflight_conversations)
 
 
 def main():
@@ -78,10 +118,10 @@ def main():
     parser.add_argument("--input_path", type=str, required=True)
     parser.add_argument("--output_path", type=str, required=True)
     parser.add_argument("--aggregation_mode", type=str, default="any")
+    parser.add_argument("--max_inflight_conversations", type=int, default=16)
     args = parser.parse_args()
     conversation_list = io_utils.load_jsonl(args.input_path)
     model_wrapper = classification.ModelWrapper(
-        openai_client=openai.AsyncOpenAI(),
         model="gpt-4o-mini-2024-07-18",
         max_concurrent=20,
     )
@@ -97,14 +137,15 @@ def main():
         "assets/definitions/emoclassifiers_v1_dependency.json"
     ))["dependency"]
     aggregator = aggregation.AGGREGATOR_DICT[args.aggregation_mode]
-    result = asyncio.run(run_classification(
+    asyncio.run(run_classification(
         conversation_list=conversation_list,
         top_level_classifiers=top_level_classifiers,
         sub_classifiers=sub_classifiers,
         dependency_graph=dependency_graph,
         aggregator=aggregator,
+        output_path=args.output_path,
+        max_inflight_conversations=args.max_inflight_conversations,
     ))
-    io_utils.save_jsonl(result, args.output_path)
     print(f"Saved results to {args.output_path}")
 
 
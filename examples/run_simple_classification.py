@@ -1,33 +1,52 @@
 import argparse
 import asyncio
-import openai
 
 import emoclassifiers.io_utils as io_utils
 import emoclassifiers.classification as classification
 import emoclassifiers.aggregation as aggregation
 
 
+async def classify_single_conversation(
+    conversation: list[dict],
+    classifiers: dict[str, classification.EmoClassifier],
+    aggregator: aggregation.Aggregator,
+) -> dict:
+    # Classifiers sharing a chunker share chunks, so each chunk is only rendered once
+    chunks_by_chunker = {}
+    chunk_tasks_by_classifier = {}
+    async with asyncio.TaskGroup() as tg:
+        for classifier_name, classifier in classifiers.items():
+            chunker_name = classifier.classifier_definition["chunker"]
+            if chunker_name not in chunks_by_chunker:
+                chunks_by_chunker[chunker_name] = classifier.chunk_conversation(conversation)
+            chunk_tasks_by_classifier[classifier_name] = classifier.create_chunk_tasks(
+                chunks_by_chunker[chunker_name],
+                stop_on_first_yes=aggregator.supports_short_circuit,
+                create_task=tg.create_task,
+            )
+    return {
+        classifier_name: aggregator.aggregate(chunk_tasks.results())
+        for classifier_name, chunk_tasks in chunk_tasks_by_classifier.items()
+    }
+
+
 async def run_classification(
     conversation_list: list[dict],
     classifiers: dict[str, classification.EmoClassifier],
     aggregator: aggregation.Aggregator,
-) -> list[dict]:
-    futures_keys = []
-    futures = []
+    output_path: str,
+    max_inflight_conversations: int = 16,
+):
     print(f"Running {len(conversation_list)} conversations with {len(classifiers)} classifiers")
-    for conversation_id, conversation in enumerate(conversation_list):
-        for classifier_name, classifier in classifiers.items():
-            futures.append(classifier.classify_conversation(conversation))
-            futures_keys.append({
-                "conversation_id": conversation_id,
-                "classifier_name": classifier_name,
-            })
-    raw_results = await asyncio.gather(*futures)
-    results_by_conversation = [{} for _ in range(len(conversation_list))]
-    for key, raw_result in zip(futures_keys, raw_results):
-        result = aggregator.aggregate(raw_result)
-        results_by_conversation[key["conversation_id"]][key["classifier_name"]] = result
-    return results_by_conversation
+    futures = (
+        classify_single_conversation(
+            conversation=conversation,
+            classifiers=classifiers,
+            aggregator=aggregator,
+        )
+        for conversation in conversation_list
+    )
+    await io_utils.save_jsonl_as_completed(futures, output_path, window=max_inflight_conversations)
 
 
 def main():
@@ -36,10 +55,10 @@ def main():
     parser.add_argument("--output_path", type=str, required=True)
     parser.add_argument("--classifier_set", type=str, default="v1")
     parser.add_argument("--aggregation_mode", type=str, default="any")
+    parser.add_argument("--max_inflight_conversations", type=int, default=16)
     args = parser.parse_args()
     conversation_list = io_utils.load_jsonl(args.input_path)
     model_wrapper = classification.ModelWrapper(
-        openai_client=openai.AsyncOpenAI(),
         model="gpt-4o-mini-2024-07-18",
         max_concurrent=20,
     )
@@ -48,12 +67,13 @@ def main():
         model_wrapper=model_wrapper,
     )
     aggregator = aggregation.AGGREGATOR_DICT[args.aggregation_mode]
-    result = asyncio.run(run_classification(
+    asyncio.run(run_classification(
         conversation_list=conversation_list,
         classifiers=classifiers,
         aggregator=aggregator,
+        output_path=args.output_path,
+        max_inflight_conversations=args.max_inflight_conversations,
     ))
-    io_utils.save_jsonl(result, args.output_path)
     print(f"Saved results to {args.output_path}")
 
 
@@ -1,6 +1,5 @@
 import argparse
 import asyncio
-import openai
 import json
 
 import emoclassifiers.io_utils as io_utils
@@ -34,7 +33,10 @@ async def run_classification(
     print(f"Running {len(conversation_list)} conversations with {len(classifiers)} classifiers")
     for conversation_id, conversation in enumerate(conversation_list):
         for classifier_name, classifier in classifiers.items():
-            futures.append(classifier.classify_conversation(conversation))
+            futures.append(classifier.classify_conversation(
+                conversation,
+                stop_on_first_yes=aggregator.supports_short_circuit,
+            ))
             futures_keys.append({
                 "conversation_id": conversation_id,
                 "classifier_name": classifier_name,
@@ -56,7 +58,6 @@ def main():
     args = parser.parse_args()
     conversation_list = io_utils.load_jsonl(args.input_path)
     model_wrapper = classification.ModelWrapper(
-        openai_client=openai.AsyncOpenAI(),
         model="gpt-4o-mini-2024-07-18",
         max_concurrent=20,
     )
@@ -0,0 +1,42 @@
+import asyncio
+import types
+from typing import Callable
+
+import pytest
+
+
+class FakeCompletions:
+    """
+    Stand-in for `openai_client.beta.chat.completions` that answers each prompt
+    deterministically after a delay.
+    """
+    def __init__(self, label_fn: Callable[[str], str], delay_fn: Callable[[str], float]):
+        self.label_fn = label_fn
+        self.delay_fn = delay_fn
+        self.num_started = 0
+        self.num_cancelled = 0
+        self.num_completed = 0
+
+    async def parse(self, model, messages, response_format, max_completion_tokens, **kwargs):
+        prompt = messages[0]["content"]
+        self.num_started += 1
+        try:
+            await asyncio.sleep(self.delay_fn(prompt))
+        except asyncio.CancelledError:
+            self.num_cancelled += 1
+            raise
+        self.num_completed += 1
+        parsed = response_format.model_validate({"response": self.label_fn(prompt)})
+        message = types.SimpleNamespace(parsed=parsed)
+        return types.SimpleNamespace(choices=[types.SimpleNamespace(message=message)])
+
+
+class FakeOpenAIClient:
+    def __init__(self, label_fn: Callable[[str], str], delay_fn: Callable[[str], float] = lambda prompt: 0.01):
+        self.completions = FakeCompletions(label_fn=label_fn, delay_fn=delay_fn)
+        self.beta = types.SimpleNamespace(chat=types.SimpleNamespace(completions=self.completions))
+
+
+@pytest.fixture
+def make_fake_openai_client():
+    return FakeOpenAIClient
@@ -0,0 +1,142 @@
+import asyncio
+
+import pytest
+
+from emoclassifiers.caching import AsyncLRUCache
+
+
+async def _yield_loop(num_iterations: int):
+    for _ in range(num_iterations):
+        await asyncio.sleep(0)
+
+
+def test_concurrent_callers_share_one_computation():
+    async def run():
+        cache = AsyncLRUCache(maxsize=8)
+        num_calls = 0
+
+        async def compute():
+            nonlocal num_calls
+            num_calls += 1
+            await asyncio.sleep(0.01)
+            return "ok"
+
+        results = await asyncio.gather(*[cache.get_or_compute(b"key", compute) for _ in range(5)])
+        assert results == ["ok"] * 5
+        assert await cache.get_or_compute(b"key", compute) == "ok"
+        assert num_calls == 1
+
+    asyncio.run(run())
+
+
+def test_failures_are_not_cached():
+    async def run():
+        cache = AsyncLRUCache(maxsize=8)
+
+        async def fail():
+            raise ValueError("boom")
+
+        async def succeed():
+            return "ok"
+
+        with pytest.raises(ValueError):
+            await cache.get_or_compute(b"key", fail)
+        assert await cache.get_or_compute(b"key", succeed) == "ok"
+
+    asyncio.run(run())
+
+
+@pytest.mark.parametrize("num_iterations", range(6))
+def test_late_caller_is_not_cancelled_by_other_caller(num_iterations):
+    """
+    Caller A is cancelled, which cancels the shared computation. Caller B, arriving
+    for the same key just before or just after the computation dies, must get a result.
+    """
+    async def run():
+        cache = AsyncLRUCache(maxsize=8)
+
+        async def compute():
+            await asyncio.sleep(0.01)
+            return "ok"
+
+        caller_a = asyncio.create_task(cache.get_or_compute(b"key", compute))
+        await asyncio.sleep(0)
+        caller_a.cancel()
+        await _yield_loop(num_iterations)
+        caller_b = asyncio.create_task(cache.get_or_compute(b"key", compute))
+        with pytest.raises(asyncio.CancelledError):
+            await caller_a
+        assert await caller_b == "ok"
+
+    asyncio.run(run())
+
+
+def test_cancelled_computation_is_not_retried():
+    """
+    A computation that is cancelled by something other than the cache (e.g. the
+    API client) is raised to its callers rather than recomputed.
+    """
+    async def run():
+        cache = AsyncLRUCache(maxsize=8)
+        num_calls = 0
+
+        async def compute():
+            nonlocal num_calls
+            num_calls += 1
+            await asyncio.sleep(0)
+            raise asyncio.CancelledError()
+
+        results = await asyncio.gather(
+            *[cache.get_or_compute(b"key", compute) for _ in range(2)],
+            return_exceptions=True,
+        )
+        assert all(isinstance(result, asyncio.CancelledError) for result in results)
+        assert num_calls == 1
+
+    asyncio.run(run())
+
+
+def test_cancelling_only_caller_cancels_computation():
+    async def run():
+        cache = AsyncLRUCache(maxsize=8)
+        started = asyncio.Event()
+        cancelled = asyncio.Event()
+
+        async def compute():
+            started.set()
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        caller = asyncio.create_task(cache.get_or_compute(b"key", compute))
+        await started.wait()
+        caller.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await caller
+        await asyncio.wait_for(cancelled.wait(), timeout=1)
+        assert b"key" not in cache._tasks
+
+    asyncio.run(run())
+
+
+def test_finished_cancelled_task_is_a_miss():
+    """
+    A cancelled task can still be in the cache before its done-callback has run.
+    It should be recomputed rather than re-raising its CancelledError.
+    """
+    async def run():
+        cache = AsyncLRUCache(maxsize=8)
+
+        async def compute():
+            return "ok"
+
+        dead_task = asyncio.ensure_future(asyncio.sleep(10))
+        dead_task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await dead_task
+        cache._tasks[b"key"] = dead_task
+        assert await cache.get_or_compute(b"key", compute) == "ok"
+
+    asyncio.run(run())
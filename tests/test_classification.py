@@ -0,0 +1,190 @@
+import asyncio
+import types
+
+import pytest
+from openai.lib._pydantic import to_strict_json_schema
+
+import emoclassifiers.response_format as response_format
+from emoclassifiers.classification import (
+    BatchedModelWrapper,
+    ModelWrapper,
+    ResponseFormat,
+    YesNoUnsureEnum,
+    load_classifiers,
+)
+
+
+def test_response_format_schema_is_unchanged():
+    assert to_strict_json_schema(ResponseFormat) == {
+        "$defs": {
+            "YesNoUnsureEnum": {
+                "description": "Classification output.",
+                "enum": ["yes", "no", "unsure"],
+                "title": "YesNoUnsureEnum",
+                "type": "string",
+            },
+        },
+        "description": "Response format for structured completion.",
+        "properties": {"response": {"$ref": "#/$defs/YesNoUnsureEnum"}},
+        "required": ["response"],
+        "title": "ResponseFormat",
+        "type": "object",
+        "additionalProperties": False,
+    }
+
+
+def test_response_maps_to_int_enum():
+    for response in response_format.YesNoUnsureEnum:
+        result = YesNoUnsureEnum.from_response(response)
+        assert result.name == response.name
+    assert YesNoUnsureEnum.from_response(response_format.YesNoUnsureEnum.YES) == 1
+
+
+def test_batched_wrapper_resolves_requests(make_fake_openai_client):
+    async def run():
+        client = make_fake_openai_client(label_fn=lambda prompt: "yes" if "1" in prompt else "no")
+        model_wrapper = BatchedModelWrapper(openai_client=client, max_batch_size=4, cache_size=0)
+        results = await asyncio.gather(*[model_wrapper.classify_prompt(f"prompt {i}") for i in range(10)])
+        assert results == [YesNoUnsureEnum.NO, YesNoUnsureEnum.YES] + [YesNoUnsureEnum.NO] * 8
+
+    asyncio.run(run())
+
+
+def test_batched_wrapper_cancels_dispatched_request(make_fake_openai_client):
+    async def run():
+        client = make_fake_openai_client(
+            label_fn=lambda prompt: "no",
+            delay_fn=lambda prompt: 10 if "slow" in prompt else 0.01,
+        )
+        model_wrapper = BatchedModelWrapper(openai_client=client, max_batch_size=2, cache_size=0)
+        slow = asyncio.create_task(model_wrapper.classify_prompt("slow"))
+        fast = asyncio.create_task(model_wrapper.classify_prompt("fast"))
+        assert await fast == YesNoUnsureEnum.NO
+        assert client.completions.num_started == 2
+        slow.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await slow
+        await asyncio.sleep(0.01)
+        assert client.completions.num_cancelled == 1
+
+    asyncio.run(run())
+
+
+@pytest.mark.parametrize("num_iterations", range(8))
+def test_stop_on_first_yes_does_not_cancel_shared_chunk(make_fake_openai_client, num_iterations):
+    """
+    Conversation A short-circuits on a fast YES, abandoning a chunk it shares with
+    conversation B. B must still get its result, however soon after the YES it asks for the chunk.
+    """
+    async def run():
+        client = make_fake_openai_client(
+            label_fn=lambda prompt: "yes" if "so happy" in prompt else "no",
+            delay_fn=lambda prompt: 0.01 if "so happy" in prompt else 0.03,
+        )
+        classifier = load_classifiers(
+            classifier_set="v2",
+            model_wrapper=ModelWrapper(openai_client=client),
+        )["share_emotions"]
+        conversation_a = [
+            {"role": "user", "content": "Hello there."},
+            {"role": "user", "content": "I'm so happy."},
+        ]
+        conversation_b = [
+            {"role": "user", "content": "Hello there."},
+        ]
+
+        async def classify_b():
+            while not client.completions.num_completed:
+                await asyncio.sleep(0)
+            for _ in range(num_iterations):
+                await asyncio.sleep(0)
+            return await classifier.classify_conversation(conversation_b, stop_on_first_yes=True)
+
+        result_a, result_b = await asyncio.gather(
+            classifier.classify_conversation(conversation_a, stop_on_first_yes=True),
+            classify_b(),
+        )
+        # The shared chunk may also finish before A stops, if the event loop is slow
+        assert result_a[1] == YesNoUnsureEnum.YES
+        assert result_b == {0: YesNoUnsureEnum.NO}
+
+    asyncio.run(run())
+
+
+def test_stop_on_first_yes_raises_unrelated_cancellation(make_fake_openai_client):
+    """
+    Only the requests cancelled after a YES may be left out of the results. A chunk
+    cancelled for any other reason must not be silently dropped.
+    """
+    async def run():
+        client = make_fake_openai_client(label_fn=lambda prompt: "no")
+
+        async def parse(**kwargs):
+            if "Goodbye." in kwargs["messages"][0]["content"]:
+                raise asyncio.CancelledError()
+            return await client.completions.parse(**kwargs)
+
+        client.beta.chat.completions = types.SimpleNamespace(parse=parse)
+        classifier = load_classifiers(
+            classifier_set="v2",
+            model_wrapper=ModelWrapper(openai_client=client),
+        )["share_emotions"]
+        chunks = classifier.chunk_conversation([
+            {"role": "user", "content": "Hello there."},
+            {"role": "user", "content": "Goodbye."},
+        ])
+        with pytest.raises(asyncio.CancelledError):
+            await classifier.classify_chunks(chunks, stop_on_first_yes=True)
+
+    asyncio.run(run())
+
+
+def test_chunk_tasks_short_circuit_in_task_group(make_fake_openai_client):
+    async def run():
+        client = make_fake_openai_client(
+            label_fn=lambda prompt: "yes" if "so happy" in prompt else "no",
+            delay_fn=lambda prompt: 0.01 if "so happy" in prompt else 10,
+        )
+        classifier = load_classifiers(
+            classifier_set="v2",
+            model_wrapper=ModelWrapper(openai_client=client),
+        )["share_emotions"]
+        chunks = classifier.chunk_conversation([
+            {"role": "user", "content": "Hello there."},
+            {"role": "user", "content": "I'm so happy."},
+        ])
+        async with asyncio.TaskGroup() as tg:
+            chunk_tasks = classifier.create_chunk_tasks(
+                chunks,
+                stop_on_first_yes=True,
+                create_task=tg.create_task,
+            )
+        assert chunk_tasks.results() == {1: YesNoUnsureEnum.YES}
+        assert client.completions.num_cancelled == 1
+
+    asyncio.run(run())
+
+
+def test_classify_chunks_raises_error_before_cancellations(make_fake_openai_client):
+    async def run():
+        client = make_fake_openai_client(label_fn=lambda prompt: "no", delay_fn=lambda prompt: 10)
+
+        async def parse(**kwargs):
+            if "Goodbye." in kwargs["messages"][0]["content"]:
+                raise ValueError("boom")
+            return await client.completions.parse(**kwargs)
+
+        client.beta.chat.completions = types.SimpleNamespace(parse=parse)
+        classifier = load_classifiers(
+            classifier_set="v2",
+            model_wrapper=ModelWrapper(openai_client=client),
+        )["share_emotions"]
+        chunks = classifier.chunk_conversation([
+            {"role": "user", "content": "Hello there."},
+            {"role": "user", "content": "Goodbye."},
+        ])
+        with pytest.raises(ValueError):
+            await classifier.classify_chunks(chunks)
+        assert client.completions.num_cancelled == 1
+
+    asyncio.run(run())
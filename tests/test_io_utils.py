@@ -0,0 +1,49 @@
+import asyncio
+
+import pytest
+
+import emoclassifiers.io_utils as io_utils
+
+
+def test_save_jsonl_as_completed_keeps_order_within_window(tmp_path):
+    window = 4
+    num_running = 0
+    max_running = 0
+
+    async def make_item(idx: int) -> dict:
+        nonlocal num_running, max_running
+        num_running += 1
+        max_running = max(max_running, num_running)
+        # The first item is the slowest, so later ones complete out of order
+        await asyncio.sleep(0.02 if idx == 0 else 0.001)
+        num_running -= 1
+        return {"idx": idx}
+
+    path = tmp_path / "out.jsonl"
+    futures = (make_item(idx) for idx in range(20))
+    asyncio.run(io_utils.save_jsonl_as_completed(futures, str(path), window=window))
+    assert io_utils.load_jsonl(str(path)) == [{"idx": idx} for idx in range(20)]
+    assert max_running == window
+
+
+def test_save_jsonl_as_completed_cancels_running_tasks_on_error(tmp_path):
+    num_started = 0
+    cancelled = []
+
+    async def make_item(idx: int) -> dict:
+        nonlocal num_started
+        num_started += 1
+        if idx == 1:
+            raise ValueError("boom")
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(idx)
+            raise
+        return {"idx": idx}
+
+    futures = (make_item(idx) for idx in range(20))
+    with pytest.raises(ValueError):
+        asyncio.run(io_utils.save_jsonl_as_completed(futures, str(tmp_path / "out.jsonl"), window=4))
+    assert num_started == 4
+    assert sorted(cancelled) == [0, 2, 3]